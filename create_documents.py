@@ -1,8 +1,13 @@
-import json
+import multiprocessing
+import orjson
 import os
+import threading
 import time
-import pdfplumber
 import requests
+from requests.adapters import HTTPAdapter
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from io import StringIO
 from pathlib import Path
 
 import logging
@@ -18,158 +23,274 @@ logging.basicConfig(
 )
 
 
-def download_pdf(arxiv_id, output_path):
-   """Download PDF from arXiv"""
-   url = f"https://export.arxiv.org/pdf/{arxiv_id}"
-   headers = {
+class RateLimiter:
+    """Allow at most burst_size requests in any sleep_time second window, shared across threads"""
+
+    def __init__(self, burst_size=4, sleep_time=1):
+        self.burst_size = burst_size
+        self.sleep_time = sleep_time
+        self.request_times = deque()
+        self.lock = threading.Lock()
+
+    def wait_if_needed(self):
+        # Holding the lock while sleeping makes the other download threads queue up behind us
+        # time.monotonic() can't jump with the wall clock, which could otherwise stall the limiter
+        with self.lock:
+            now = time.monotonic()
+            if len(self.request_times) == self.burst_size:
+                delta = now - self.request_times[0]
+                if delta < self.sleep_time:
+                    time.sleep(self.sleep_time - delta)
+                self.request_times.popleft()
+            self.request_times.append(time.monotonic())
+
+
+def create_session(pool_size=8):
+   """Create an HTTP session that keeps connections to arXiv alive"""
+   session = requests.Session()
+   session.headers.update({
        'User-Agent': 'Mozilla/5.0 (Python script for academic research; Contact: your@email.com)'
-   }
+   })
+   session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+   return session
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def download_pdf(arxiv_id, session, rate_limiter, max_retries=3, backoff_factor=0.5):
+   """Download PDF from arXiv and return its bytes, or None on failure"""
+   url = f"https://export.arxiv.org/pdf/{arxiv_id}"
    
-   try:
-       response = requests.get(url, headers=headers)
-       response.raise_for_status()
+   # Retries are done here rather than by urllib3 so that every attempt goes through the rate limiter
+   for attempt in range(max_retries + 1):
+       delay = backoff_factor * 2 ** attempt
+       try:
+           rate_limiter.wait_if_needed()
+           # Closing the response hands the connection back to the session's pool
+           with session.get(url, stream=True, timeout=30) as response:
+               if response.status_code in RETRY_STATUSES and attempt < max_retries:
+                   # Honour the server's Retry-After when it asks for a longer pause
+                   retry_after = response.headers.get('Retry-After', '')
+                   if retry_after.isdigit():
+                       delay = max(delay, int(retry_after))
+                   error = f"HTTP {response.status_code}"
+               else:
+                   response.raise_for_status()
+                   return b''.join(response.iter_content(chunk_size=131072))
+       except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+           if attempt == max_retries:
+               logging.error(f"Error downloading {arxiv_id}: {str(e)}")
+               return None
+           error = str(e)
+       except Exception as e:
+           logging.error(f"Error downloading {arxiv_id}: {str(e)}")
+           return None
        
-       with open(output_path, 'wb') as f:
-           f.write(response.content)
-       return True
-   except Exception as e:
-       logging.error(f"Error downloading {arxiv_id}: {str(e)}")
-       return False
+       logging.info(f"Retrying {arxiv_id} in {delay:.1f}s after {error}")
+       time.sleep(delay)
 
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF with focus on proper word separation"""
+def extract_text_from_pdf(pdf_bytes, pages=None, max_pages=None):
+    """
+    Extract text from PDF with focus on proper word separation
+    
+    Only the page indices in the range pages are parsed when it is given. Otherwise, if the PDF has
+    more than max_pages pages, only the first max_pages are parsed so the caller can hand the rest to
+    other workers. Returns (text, page_count); text is None if extraction failed.
+    """
+    # Imported here so each parser process sets up MuPDF's state on its own
+    import pymupdf
+
     try:
-        text_content = []
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                # Extract words with their positions
-                words = page.extract_words(
-                    keep_blank_chars=False,
-                    x_tolerance=1,
-                    y_tolerance=3,
-                    split_at_punctuation=True,
-                )
+        text_content = StringIO()
+        with pymupdf.open(stream=pdf_bytes, filetype='pdf') as pdf:
+            page_count = pdf.page_count
+            if pages is None and max_pages is not None and page_count > max_pages:
+                pages = range(0, max_pages)
+            
+            for page in (pdf if pages is None else pdf.pages(pages.start, pages.stop)):
+                # Extract words as (x0, y0, x1, y1, text, block_no, line_no, word_no)
+                words = page.get_text("words")
                 
                 if words:
-                    # Sort words by vertical position then horizontal
-                    words.sort(key=lambda w: (round(w['top'], 1), w['x0']))
-                    
-                    # Group words into lines
-                    current_line = []
-                    current_y = None
-                    lines = []
-                    
-                    for word in words:
-                        if current_y is None:
-                            current_y = round(word['top'], 1)
-                        
-                        # If significant y-position change, start new line
-                        if abs(round(word['top'], 1) - current_y) > 3:
-                            if current_line:
-                                # Join words in the line with proper spacing
-                                lines.append(' '.join(current_line))
-                                current_line = []
-                            current_y = round(word['top'], 1)
-                        
-                        # Clean the word text
-                        word_text = word['text'].strip()
-                        if word_text:
-                            current_line.append(word_text)
+                    # Round each word's top once and sort by it; a word more than 3pt below the
+                    # first word of the current line starts a new line
+                    tops = sorted(((round(w[1], 1), w) for w in words), key=lambda item: item[0])
+                    line_groups = []
+                    line_top = None
+                    for top, word in tops:
+                        if line_top is None or top - line_top > 3:
+                            line_groups.append([])
+                            line_top = top
+                        line_groups[-1].append(word)
                     
-                    # Add last line
-                    if current_line:
-                        lines.append(' '.join(current_line))
+                    page_has_text = False
+                    for group in line_groups:
+                        # Order the line left to right and join words with proper spacing
+                        group.sort(key=lambda w: w[0])
+                        line = ' '.join(w[4].strip() for w in group if w[4].strip())
+                        if line:
+                            text_content.write(line)
+                            text_content.write("\n")
+                            page_has_text = True
                     
-                    # Add page content
-                    if lines:
-                        text_content.append("\n".join(lines))
-                        text_content.append("\n")  # Add separation between pages
+                    # Add separation between pages
+                    if page_has_text:
+                        text_content.write("\n")
         
-        return '\n'.join(text_content)
+        return text_content.getvalue(), page_count
     except Exception as e:
         logging.error(f"Error extracting text from PDF: {str(e)}")
-        return None
+        return None, 0
+    finally:
+        # MuPDF keeps decoded fonts and images in a global store that outlives the document;
+        # empty it so a long-lived worker's memory stays flat across PDFs
+        pymupdf.TOOLS.store_shrink(100)
 
 
-def process_papers(input_file, output_dir, resume=True):
-   """Process papers in bursts of 4 with 1 second sleep between bursts"""
+def save_failed_pdf(pdf_bytes, output_dir, arxiv_id):
+   """Keep a PDF whose text extraction failed on disk so it can be inspected later"""
+   try:
+       with open(os.path.join(output_dir, f"{arxiv_id}.pdf"), 'wb') as f:
+           f.write(pdf_bytes)
+   except OSError as e:
+       logging.error(f"Error saving failed PDF {arxiv_id}: {str(e)}")
+
+
+# Pages parsed per worker job; longer PDFs are split into ranges of this size
+PAGES_PER_JOB = 64
+
+def process_papers(input_file, output_dir, resume=True, max_downloads=4, max_workers=None, log_flush_every=50):
+   """Download papers concurrently (rate limited to 4 requests per second) and extract their text on all cores"""
    Path(output_dir).mkdir(parents=True, exist_ok=True)
    
    processed = 0
    failed = 0
    
-   # Track processed papers if resuming
+   # Papers with an output .txt are done; the log is kept only as a record of what each run processed
    log_file = os.path.join(output_dir, "processed_papers.log")
    processed_ids = set()
    
-   if resume and os.path.exists(log_file):
-       with open(log_file, 'r') as f:
-           processed_ids = set(line.strip() for line in f)
+   if resume:
+       with os.scandir(output_dir) as entries:
+           processed_ids = {entry.name[:-4] for entry in entries if entry.name.endswith('.txt')}
    
-   # Load papers
-   with open(input_file, 'r') as f:
-       papers = json.load(f)
+   rate_limiter = RateLimiter(burst_size=4, sleep_time=1)
+   max_workers = max_workers or os.cpu_count()
+   # Recycle parser processes periodically so memory leaked inside the PDF library is handed back to the OS.
+   # Like every spawned worker, each replacement re-imports this module and so re-runs logging.basicConfig,
+   # which is what lets worker errors reach processing.log
+   parser_options = {'max_tasks_per_child': 50} if sys.version_info >= (3, 11) else {}
+   # Cap the papers in flight so downloaded PDFs can't pile up in memory faster than they are parsed
+   max_in_flight = max_downloads + 2 * max_workers
+   in_flight = {}  # future -> (stage, paper, job, chunk index)
    
-   # Open log file in append mode
-   with open(log_file, 'a') as log:
-       # Process in batches of 4
-       for i in range(0, len(papers), 4):
-           batch = papers[i:i+4]
-           logging.info(f"\nProcessing batch {i//4 + 1}/{(len(papers) + 3)//4}")
-           
-           # Process each paper in the batch
-           for paper in batch:
-               arxiv_id = paper['id']
+   # Downloads run on threads and parsing on worker processes; only this thread touches the
+   # output files and the log. Parser processes are always spawned: forking while the download
+   # threads may hold the logging or rate limiter locks can deadlock a child
+   with open(input_file, 'rb') as f, \
+           open(log_file, 'a') as log, \
+           create_session(pool_size=max(8, max_downloads)) as session, \
+           ThreadPoolExecutor(max_workers=max_downloads) as downloader, \
+           ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                               **parser_options) as parser:
+       # Papers are read one JSONL line at a time, so downloads start before the whole file is parsed
+       papers = (orjson.loads(line) for line in f if line.strip())
+       
+       while True:
+           # Top up the download queue
+           while len(in_flight) < max_in_flight:
+               paper = next(papers, None)
+               if paper is None:
+                   break
                
                # Skip if already processed
-               if arxiv_id in processed_ids:
+               if paper['id'] in processed_ids:
                    processed += 1
                    continue
                
-               logging.info(f"Processing paper: {arxiv_id}")
-               
-               pdf_path = os.path.join(output_dir, f"{arxiv_id}.pdf")
+               in_flight[downloader.submit(download_pdf, paper['id'], session, rate_limiter)] = ('download', paper, None, None)
+           
+           if not in_flight:
+               break
+           
+           done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+           for future in done:
+               stage, paper, job, index = in_flight.pop(future)
+               arxiv_id = paper['id']
                output_path = os.path.join(output_dir, f"{arxiv_id}.txt")
+               tmp_path = output_path + '.tmp'
                
-               try:
-                   # Download and process
-                   if not download_pdf(arxiv_id, pdf_path):
+               if stage == 'download':
+                   pdf_bytes = future.result()
+                   if pdf_bytes:
+                       logging.info(f"Processing paper: {arxiv_id}")
+                       # The first job parses at most PAGES_PER_JOB pages and reports the page count, so
+                       # this thread never has to open the PDF itself
+                       job = {'pdf_bytes': pdf_bytes, 'texts': [None], 'remaining': 1}
+                       in_flight[parser.submit(extract_text_from_pdf, pdf_bytes, None, PAGES_PER_JOB)] = ('extract', paper, job, 0)
+                   else:
                        failed += 1
-                       continue
+                   continue
+               
+               try:
+                   text, page_count = future.result()
+                   job['texts'][index] = text
                    
-                   paper_text = extract_text_from_pdf(pdf_path)
+                   # Hand the pages the first job skipped to other workers as separate ranges
+                   if index == 0 and text is not None and page_count > PAGES_PER_JOB:
+                       for start in range(PAGES_PER_JOB, page_count, PAGES_PER_JOB):
+                           pages = range(start, min(start + PAGES_PER_JOB, page_count))
+                           job['texts'].append(None)
+                           job['remaining'] += 1
+                           future = parser.submit(extract_text_from_pdf, job['pdf_bytes'], pages)
+                           in_flight[future] = ('extract', paper, job, len(job['texts']) - 1)
+               except Exception as e:
+                   logging.error(f"Error extracting text from {arxiv_id}: {str(e)}")
+               job['remaining'] -= 1
+               
+               # Wait until every page range of this paper has been parsed
+               if job['remaining']:
+                   continue
+               
+               pdf_bytes = job['pdf_bytes']
+               try:
+                   # Chunks come back as None on failure; each one already ends with its page separator
+                   texts = job['texts']
+                   paper_text = None if None in texts else ''.join(texts)
                    if not paper_text:
                        failed += 1
-                       if os.path.exists(pdf_path):
-                           os.remove(pdf_path)
+                       save_failed_pdf(pdf_bytes, output_dir, arxiv_id)
                        continue
                    
-                   # Save output
-                   with open(output_path, 'w', encoding='utf-8') as out_f:
-                       out_f.write("---METADATA---\n")
-                       json.dump(paper, out_f, ensure_ascii=False, indent=2)
-                       out_f.write("\n---FULLTEXT---\n")
-                       out_f.write(paper_text)
+                   # Save output with a single write
+                   document = b''.join([
+                       b"---METADATA---\n",
+                       orjson.dumps(paper, option=orjson.OPT_INDENT_2),
+                       b"\n---FULLTEXT---\n",
+                       paper_text.encode('utf-8'),
+                   ])
+                   # Write to a temporary name first so a crash can't leave a truncated .txt that resume would skip
+                   with open(tmp_path, 'wb') as out_f:
+                       out_f.write(document)
+                   os.replace(tmp_path, output_path)
                    
-                   # Cleanup
-                   os.remove(pdf_path)
-                   
-                   # Log successful processing
+                   # Log successful processing; the file's own buffer holds the ids and is flushed
+                   # every few papers (and on close) rather than after every single one
                    log.write(f"{arxiv_id}\n")
-                   log.flush()
-                   
                    processed += 1
+                   if processed % log_flush_every == 0:
+                       log.flush()
                    
                except Exception as e:
                    logging.info(f"Error processing paper {arxiv_id}: {str(e)}")
                    failed += 1
-                   if os.path.exists(pdf_path):
-                       os.remove(pdf_path)
-           
-           # Sleep between batches
-           time.sleep(1)
-           logging.info(f"Progress: Processed {processed}, Failed: {failed}")
+                   if os.path.exists(tmp_path):
+                       os.remove(tmp_path)
+                   save_failed_pdf(pdf_bytes, output_dir, arxiv_id)
+               
+               if (processed + failed) % 4 == 0:
+                   logging.info(f"Progress: Processed {processed}, Failed: {failed}")
    
    logging.info(f"\nProcessing complete!")
    logging.info(f"Successfully processed: {processed}")
@@ -178,7 +299,7 @@ def process_papers(input_file, output_dir, resume=True):
 
 if __name__ == "__main__":
    process_papers(
-       input_file="data/cs_papers_filtered.json",
+       input_file="data/cs_papers_filtered.jsonl",
        output_dir="data/papers",
        resume=True  # Enable resuming from previous run
    )
@@ -1,15 +1,22 @@
-import json
+import orjson
 from datetime import datetime
-import re
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
 
 def parse_date(date_str):
-    """Parse date string from arxiv format to datetime object"""
+    """Parse date string from arxiv format (e.g. 'Mon, 2 Apr 2007 19:18:42 GMT') to datetime object"""
+    # The format is fixed, so split it by hand instead of going through strptime's format interpreter
     try:
-        return datetime.strptime(date_str.strip(), '%a, %d %b %Y %H:%M:%S %Z')
-    except ValueError:
+        _, day, month, year, clock, _ = date_str.split()
+        hour, minute, second = clock.split(':')
+        return datetime(int(year), MONTHS[month], int(day), int(hour), int(minute), int(second))
+    except (ValueError, KeyError):
         return None
 
-def filter_papers(input_file, start_date=None, end_date=None, output_file="cs_papers_filtered.json"):
+def filter_papers(input_file, start_date=None, end_date=None, output_file="cs_papers_filtered.jsonl"):
     """
     Filter papers by CS category and date range
     
@@ -17,7 +24,7 @@ def filter_papers(input_file, start_date=None, end_date=None, output_file="cs_pa
         input_file (str): Path to input JSON file
         start_date (str): Start date in format 'YYYY-MM-DD' (inclusive)
         end_date (str): End date in format 'YYYY-MM-DD' (inclusive)
-        output_file (str): Path to output JSON file
+        output_file (str): Path to output JSONL file (one paper per line)
     """
     # Convert date strings to datetime objects if provided
     start_dt = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
@@ -28,14 +35,11 @@ def filter_papers(input_file, start_date=None, end_date=None, output_file="cs_pa
     
     print("Starting to process papers...")
     
-    with open(input_file, 'r') as f, open(output_file, 'w') as out_f:
-        # Write opening bracket for JSON array
-        out_f.write('[\n')
-        first_entry = True
-        
+    # Read raw bytes with a large buffer; orjson parses them without a separate decode step
+    with open(input_file, 'rb', buffering=1 << 20) as f, open(output_file, 'wb') as out_f:
         for line in f:
             try:
-                paper = json.loads(line.strip())
+                paper = orjson.loads(line)
                 count += 1
                 
                 if count % 100000 == 0:
@@ -43,7 +47,7 @@ def filter_papers(input_file, start_date=None, end_date=None, output_file="cs_pa
                 
                 # Check categories
                 categories = paper.get('categories', '')
-                if not any(re.match(r'^cs\.', cat) for cat in categories.split()):
+                if not any(cat.startswith('cs.') for cat in categories.split()):
                     continue
                 
                 # Get creation date from v1 version
@@ -65,22 +69,15 @@ def filter_papers(input_file, start_date=None, end_date=None, output_file="cs_pa
                 # If we get here, the paper matches all criteria
                 cs_count += 1
                 
-                # Write comma before entry if it's not the first one
-                if not first_entry:
-                    out_f.write(',\n')
-                first_entry = False
-                
-                # Write the paper data
-                json.dump(paper, out_f)
+                # Write the paper data as one JSON line
+                out_f.write(orjson.dumps(paper))
+                out_f.write(b'\n')
                 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 print(f"Warning: Skipping invalid JSON at line {count}")
             except Exception as e:
                 print(f"Warning: Error processing line {count}: {str(e)}")
     
-        # Write closing bracket for JSON array
-        out_f.write('\n]')
-    
     print(f"\nProcessing complete!")
     print(f"Total papers processed: {count:,}")
     print(f"CS papers found: {cs_count:,}")
@@ -92,6 +89,6 @@ if __name__ == "__main__":
         input_file="data/arxiv-metadata-oai-snapshot.json",
         start_date="2024-12-01",  # Optional: filter papers from this date
         end_date="2024-12-31",    # Optional: filter papers until this date
-        output_file="data/cs_papers_filtered.json"
+        output_file="data/cs_papers_filtered.jsonl"
     )
 
@@ -0,0 +1,45 @@
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+from create_documents import extract_text_from_pdf
+
+
+def make_pdf(*words):
+    """Build a one-page PDF with each (x, baseline, text, fontsize) word inserted at its position"""
+    doc = pymupdf.open()
+    page = doc.new_page()
+    for x, y, text, fontsize in words:
+        page.insert_text((x, y), text, fontsize=fontsize)
+    return doc.tobytes()
+
+
+def test_mixed_font_sizes_on_one_baseline_stay_on_one_line():
+    # The two tops are ~1pt apart and straddle a multiple of 3
+    pdf_bytes = make_pdf((72, 101, "Hello", 11), (110, 101, "World", 10))
+    assert extract_text_from_pdf(pdf_bytes) == ("Hello World\n\n", 1)
+
+
+def test_words_are_ordered_left_to_right_within_a_line():
+    pdf_bytes = make_pdf((150, 101, "World", 10), (72, 101, "Hello", 11))
+    assert extract_text_from_pdf(pdf_bytes) == ("Hello World\n\n", 1)
+
+
+def test_separate_baselines_become_separate_lines():
+    pdf_bytes = make_pdf((72, 101, "first", 11), (72, 115, "second", 11))
+    assert extract_text_from_pdf(pdf_bytes) == ("first\nsecond\n\n", 1)
+
+
+def test_page_ranges_concatenate_to_the_whole_document():
+    doc = pymupdf.open()
+    for i in range(5):
+        doc.new_page().insert_text((72, 72), f"page {i}")
+    pdf_bytes = doc.tobytes()
+    
+    whole, page_count = extract_text_from_pdf(pdf_bytes)
+    first, first_count = extract_text_from_pdf(pdf_bytes, max_pages=2)
+    rest = [extract_text_from_pdf(pdf_bytes, range(start, min(start + 2, 5)))[0] for start in (2, 4)]
+    
+    assert page_count == first_count == 5
+    assert first == "page 0\n\npage 1\n\n"
+    assert first + ''.join(rest) == whole